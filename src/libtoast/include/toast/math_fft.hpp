@@ -7,6 +7,7 @@
 #define TOAST_MATH_FFT_HPP
 
 #include <vector>
+#include <mutex>
 
 
 namespace toast {
@@ -79,6 +80,9 @@ class FFTPlanReal1DStore {
 
         std::map <std::pair <int64_t, int64_t>, FFTPlanReal1D::pshr> fplans_;
         std::map <std::pair <int64_t, int64_t>, FFTPlanReal1D::pshr> rplans_;
+
+        // Serializes access to the plan maps from multiple threads.
+        std::mutex lock_;
 };
 }
 
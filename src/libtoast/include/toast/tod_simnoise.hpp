@@ -16,6 +16,13 @@ void tod_sim_noise_timestream(
     uint64_t obsindx, uint64_t detindx, double rate, int64_t firstsamp,
     int64_t samples, int64_t oversample, const double * freq,
     const double * psd, int64_t psdlen, double * noise);
+
+void tod_sim_noise_timestream_batch(
+    uint64_t realization, uint64_t telescope, uint64_t component,
+    uint64_t obsindx, double rate, int64_t firstsamp, int64_t samples,
+    int64_t oversample, int64_t nstream, const uint64_t * detindx,
+    const int64_t * psdlens, const double * freq, const double * psd,
+    double * noise);
 }
 
 #endif // ifndef TOAST_TOD_SIMNOISE_HPP
@@ -12,6 +12,7 @@
 #include <cstring>
 #include <cmath>
 #include <vector>
+#include <mutex>
 
 
 // In all cases, the memory buffer used for these FFTs is allocated as a single
@@ -22,12 +23,22 @@
 
 #ifdef HAVE_FFTW
 
+// The FFTW planner is not thread-safe, so plan creation and destruction are
+// serialized with this lock.
+
+static std::mutex & fftw_planner_lock() {
+    static std::mutex lock;
+    return lock;
+}
+
 toast::FFTPlanReal1DFFTW::FFTPlanReal1DFFTW(
     int64_t length, int64_t n, toast::fft_plan_type type,
     toast::fft_direction dir, double scale) :
     toast::FFTPlanReal1D(length, n, type, dir, scale) {
     int threads = 1;
 
+    std::lock_guard <std::mutex> planner(fftw_planner_lock());
+
     // enable threads
     # ifdef HAVE_FFTW_THREADS
     auto env = toast::Environment::get();
@@ -97,7 +108,10 @@ toast::FFTPlanReal1DFFTW::FFTPlanReal1DFFTW(
 }
 
 toast::FFTPlanReal1DFFTW::~FFTPlanReal1DFFTW() {
-    fftw_destroy_plan(static_cast <fftw_plan> (plan_));
+    {
+        std::lock_guard <std::mutex> planner(fftw_planner_lock());
+        fftw_destroy_plan(static_cast <fftw_plan> (plan_));
+    }
     tview_.clear();
     fview_.clear();
     data_.clear();
@@ -469,6 +483,7 @@ toast::FFTPlanReal1D * toast::FFTPlanReal1D::create(int64_t length, int64_t n,
 toast::FFTPlanReal1DStore::~FFTPlanReal1DStore() {}
 
 void toast::FFTPlanReal1DStore::clear() {
+    std::lock_guard <std::mutex> guard(lock_);
     fplans_.clear();
     rplans_.clear();
     return;
@@ -480,6 +495,7 @@ toast::FFTPlanReal1DStore & toast::FFTPlanReal1DStore::get() {
 }
 
 void toast::FFTPlanReal1DStore::cache(int64_t len, int64_t n) {
+    std::lock_guard <std::mutex> guard(lock_);
     std::pair <int64_t, int64_t> key(len, n);
 
     std::map <std::pair <int64_t, int64_t>, toast::FFTPlanReal1D::pshr>
@@ -505,6 +521,7 @@ void toast::FFTPlanReal1DStore::cache(int64_t len, int64_t n) {
 
 toast::FFTPlanReal1D::pshr toast::FFTPlanReal1DStore::forward(int64_t len,
                                                               int64_t n) {
+    std::lock_guard <std::mutex> guard(lock_);
     std::pair <int64_t, int64_t> key(len, n);
 
     std::map <std::pair <int64_t, int64_t>, toast::FFTPlanReal1D::pshr>
@@ -522,6 +539,7 @@ toast::FFTPlanReal1D::pshr toast::FFTPlanReal1DStore::forward(int64_t len,
 
 toast::FFTPlanReal1D::pshr toast::FFTPlanReal1DStore::backward(int64_t len,
                                                                int64_t n) {
+    std::lock_guard <std::mutex> guard(lock_);
     std::pair <int64_t, int64_t> key(len, n);
 
     std::map <std::pair <int64_t, int64_t>, toast::FFTPlanReal1D::pshr>
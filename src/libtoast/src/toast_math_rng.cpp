@@ -98,22 +98,26 @@ void toast::rng_dist_normal(size_t n,
                             uint64_t key1, uint64_t key2,
                             uint64_t counter1, uint64_t counter2,
                             double * data) {
-    // First compute uniform randoms on [0.0, 1.0)
-    toast::AlignedVector <double> uni(n);
+    // First compute uniform randoms on [0.0, 1.0) directly in the output
+    // buffer and map them to [-1.0, 1.0) in place.  This avoids a
+    // temporary buffer and an extra pass over memory.
 
-    toast::rng_dist_uniform_01(n, key1, key2, counter1, counter2,
-                               uni.data());
+    toast::rng_dist_uniform_01(n, key1, key2, counter1, counter2, data);
 
-    #pragma omp simd
-    for (size_t i = 0; i < n; ++i) {
-        uni[i] = 2.0 * uni[i] - 1.0;
+    if (toast::is_aligned(data)) {
+        #pragma omp simd
+        for (size_t i = 0; i < n; ++i) {
+            data[i] = 2.0 * data[i] - 1.0;
+        }
+    } else {
+        for (size_t i = 0; i < n; ++i) {
+            data[i] = 2.0 * data[i] - 1.0;
+        }
     }
 
-    // now use the inverse error function
-
-    double * ldata = &(data[0]);
+    // now use the inverse error function, in place
 
-    toast::vfast_erfinv(n, uni.data(), ldata);
+    toast::vfast_erfinv(n, data, data);
 
     double rttwo = ::sqrt(2.0);
 
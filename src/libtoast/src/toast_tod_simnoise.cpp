@@ -4,6 +4,7 @@
 // a BSD-style license that can be found in the LICENSE file.
 
 #include <toast/sys_utils.hpp>
+#include <toast/sys_environment.hpp>
 #include <toast/math_fft.hpp>
 #include <toast/math_rng.hpp>
 #include <toast/tod_simnoise.hpp>
@@ -11,56 +12,17 @@
 #include <sstream>
 
 
-void toast::tod_sim_noise_timestream(
-    uint64_t realization, uint64_t telescope, uint64_t component,
-    uint64_t obsindx, uint64_t detindx, double rate, int64_t firstsamp,
-    int64_t samples, int64_t oversample, const double * freq,
-    const double * psd, int64_t psdlen, double * noise) {
-    /*
-       Generate a noise timestream, given a starting RNG state.
-
-       Use the RNG parameters to generate unit-variance Gaussian samples
-       and then modify the Fourier domain amplitudes to match the desired
-       PSD.
-
-       The RNG (Threefry2x64 from Random123) takes a "key" and a "counter"
-       which each consist of two unsigned 64bit integers.  These four
-       numbers together uniquely identify a single sample.  We construct
-       those four numbers in the following way:
-
-       key1 = realization * 2^32 + telescope * 2^16 + component
-       key2 = obsindx * 2^32 + detindx
-       counter1 = currently unused (0)
-       counter2 = sample in stream
-
-       counter2 is incremented internally by the RNG function as it calls
-       the underlying Random123 library for each sample.
-
-       Args:
-        realization (int): the Monte Carlo realization.
-        telescope (int): a unique index assigned to a telescope.
-        component (int): a number representing the type of timestream
-            we are generating (detector noise, common mode noise,
-            atmosphere, etc).
-        obsindx (int): the global index of this observation.
-        detindx (int): the global index of this detector.
-        rate (float): the sample rate.
-        firstsamp (int): the start sample in the stream.
-        samples (int): the number of samples to generate.
-        oversample (int): the factor by which to expand the FFT length
-            beyond the number of samples.
-        freq (array): the frequency points of the PSD.
-        psd (array): the PSD values.
-
-       Returns (tuple):
-        the timestream array, the interpolated PSD frequencies, and
-            the interpolated PSD values.
-     */
-
+static int64_t sim_noise_fftlen(int64_t samples, int64_t oversample) {
     int64_t fftlen = 2;
     while (fftlen <= (oversample * samples)) fftlen *= 2;
-    int64_t npsd = (fftlen / 2) + 1;
-    double norm = rate * static_cast <double> (npsd - 1);
+    return fftlen;
+}
+
+static double sim_noise_check_psd(double rate, int64_t fftlen,
+                                  const double * freq, const double * psd,
+                                  int64_t psdlen) {
+    // Verify that the PSD can be interpolated to the frequencies of the
+    // real FFT and return the smallest non-zero PSD value.
 
     double increment = rate / static_cast <double> (fftlen - 1);
 
@@ -103,6 +65,22 @@ void toast::tod_sim_noise_timestream(
         throw std::runtime_error(o.str().c_str());
     }
 
+    return psdmin;
+}
+
+static void sim_noise_interp_psd(double rate, int64_t fftlen,
+                                 const double * freq, const double * psd,
+                                 int64_t psdlen, double psdmin,
+                                 double * interp_psd) {
+    // Interpolate the PSD to the (npsd = fftlen / 2 + 1) frequencies of the
+    // real FFT and store the resulting Fourier domain amplitudes.  The inputs
+    // must have been verified with sim_noise_check_psd().
+
+    int64_t npsd = (fftlen / 2) + 1;
+    double norm = rate * static_cast <double> (npsd - 1);
+
+    double increment = rate / static_cast <double> (fftlen - 1);
+
     // Perform a logarithmic interpolation.  In order to avoid zero
     // values, we shift the PSD by a fixed amount in frequency and
     // amplitude.
@@ -126,8 +104,6 @@ void toast::tod_sim_noise_timestream(
         }
     }
 
-    toast::AlignedVector <double> interp_psd(npsd);
-
     #pragma omp simd
     for (int64_t i = 0; i < npsd; ++i) {
         interp_psd[i] = ::log10(increment * static_cast <double> (i) +
@@ -156,25 +132,19 @@ void toast::tod_sim_noise_timestream(
     // Zero out DC value
     interp_psd[0] = 0;
 
-    // gaussian Re/Im randoms, packed into a half-complex array
-
-    uint64_t key1 = realization * 4294967296 + telescope * 65536 + component;
-    uint64_t key2 = obsindx * 4294967296 + detindx;
-    uint64_t counter1 = 0;
-    uint64_t counter2 = static_cast <uint64_t> (firstsamp * oversample);
-    toast::AlignedVector <double> rngdata(fftlen);
-
-    toast::rng_dist_normal(fftlen, key1, key2, counter1, counter2,
-                           rngdata.data());
+    return;
+}
 
-    // Get a plan of the correct size and direction from the global
-    // per-process plan store.
+static void sim_noise_fill_fdata(uint64_t key1, uint64_t key2,
+                                 uint64_t counter1, uint64_t counter2,
+                                 int64_t fftlen, const double * interp_psd,
+                                 double * pdata) {
+    // gaussian Re/Im randoms, packed into a half-complex array and scaled
+    // by the interpolated amplitudes.
 
-    auto & store = toast::FFTPlanReal1DStore::get();
-    auto plan = store.backward(fftlen, 1);
+    toast::rng_dist_normal(fftlen, key1, key2, counter1, counter2, pdata);
 
-    double * pdata = plan->fdata(0);
-    std::copy(rngdata.begin(), rngdata.end(), pdata);
+    int64_t npsd = (fftlen / 2) + 1;
 
     pdata[0] *= interp_psd[0];
     for (int64_t i = 1; i < (fftlen / 2); ++i) {
@@ -185,14 +155,17 @@ void toast::tod_sim_noise_timestream(
 
     pdata[fftlen / 2] *= interp_psd[npsd - 1];
 
-    plan->exec();
+    return;
+}
+
+static void sim_noise_extract(int64_t fftlen, int64_t samples,
+                              const double * tdata, double * noise) {
+    // Copy the central samples of the inverse FFT and subtract the DC level.
 
     int64_t offset = (fftlen - samples) / 2;
-    pdata = plan->tdata(0) + offset;
+    const double * pdata = tdata + offset;
     std::copy(pdata, (pdata + samples), noise);
 
-    // subtract the DC level
-
     double DC = 0;
     for (int64_t i = 0; i < samples; ++i) {
         DC += noise[i];
@@ -205,3 +178,175 @@ void toast::tod_sim_noise_timestream(
 
     return;
 }
+
+void toast::tod_sim_noise_timestream(
+    uint64_t realization, uint64_t telescope, uint64_t component,
+    uint64_t obsindx, uint64_t detindx, double rate, int64_t firstsamp,
+    int64_t samples, int64_t oversample, const double * freq,
+    const double * psd, int64_t psdlen, double * noise) {
+    /*
+       Generate a noise timestream, given a starting RNG state.
+
+       Use the RNG parameters to generate unit-variance Gaussian samples
+       and then modify the Fourier domain amplitudes to match the desired
+       PSD.
+
+       The RNG (Threefry2x64 from Random123) takes a "key" and a "counter"
+       which each consist of two unsigned 64bit integers.  These four
+       numbers together uniquely identify a single sample.  We construct
+       those four numbers in the following way:
+
+       key1 = realization * 2^32 + telescope * 2^16 + component
+       key2 = obsindx * 2^32 + detindx
+       counter1 = currently unused (0)
+       counter2 = sample in stream
+
+       counter2 is incremented internally by the RNG function as it calls
+       the underlying Random123 library for each sample.
+
+       Args:
+        realization (int): the Monte Carlo realization.
+        telescope (int): a unique index assigned to a telescope.
+        component (int): a number representing the type of timestream
+            we are generating (detector noise, common mode noise,
+            atmosphere, etc).
+        obsindx (int): the global index of this observation.
+        detindx (int): the global index of this detector.
+        rate (float): the sample rate.
+        firstsamp (int): the start sample in the stream.
+        samples (int): the number of samples to generate.
+        oversample (int): the factor by which to expand the FFT length
+            beyond the number of samples.
+        freq (array): the frequency points of the PSD.
+        psd (array): the PSD values.
+
+       Returns (tuple):
+        the timestream array, the interpolated PSD frequencies, and
+            the interpolated PSD values.
+     */
+
+    int64_t fftlen = sim_noise_fftlen(samples, oversample);
+    int64_t npsd = (fftlen / 2) + 1;
+
+    double psdmin = sim_noise_check_psd(rate, fftlen, freq, psd, psdlen);
+
+    toast::AlignedVector <double> interp_psd(npsd);
+    sim_noise_interp_psd(rate, fftlen, freq, psd, psdlen, psdmin,
+                         interp_psd.data());
+
+    uint64_t key1 = realization * 4294967296 + telescope * 65536 + component;
+    uint64_t key2 = obsindx * 4294967296 + detindx;
+    uint64_t counter1 = 0;
+    uint64_t counter2 = static_cast <uint64_t> (firstsamp * oversample);
+
+    // Get a plan of the correct size and direction from the global
+    // per-process plan store.
+
+    auto & store = toast::FFTPlanReal1DStore::get();
+    auto plan = store.backward(fftlen, 1);
+
+    sim_noise_fill_fdata(key1, key2, counter1, counter2, fftlen,
+                         interp_psd.data(), plan->fdata(0));
+
+    plan->exec();
+
+    sim_noise_extract(fftlen, samples, plan->tdata(0), noise);
+
+    return;
+}
+
+void toast::tod_sim_noise_timestream_batch(
+    uint64_t realization, uint64_t telescope, uint64_t component,
+    uint64_t obsindx, double rate, int64_t firstsamp, int64_t samples,
+    int64_t oversample, int64_t nstream, const uint64_t * detindx,
+    const int64_t * psdlens, const double * freq, const double * psd,
+    double * noise) {
+    /*
+       Generate noise timestreams for several PSDs sharing the same samples.
+
+       This is equivalent to calling tod_sim_noise_timestream() once for
+       each stream, but all inverse FFTs are done with a single batched
+       plan.
+
+       Args:
+        realization (int): the Monte Carlo realization.
+        telescope (int): a unique index assigned to a telescope.
+        component (int): a number representing the type of timestream
+            we are generating (detector noise, common mode noise,
+            atmosphere, etc).
+        obsindx (int): the global index of this observation.
+        rate (float): the sample rate.
+        firstsamp (int): the start sample in the stream.
+        samples (int): the number of samples to generate.
+        oversample (int): the factor by which to expand the FFT length
+            beyond the number of samples.
+        nstream (int): the number of streams.
+        detindx (array): the global index of each stream.
+        psdlens (array): the number of PSD points of each stream.
+        freq (array): the concatenated frequency points of all PSDs.
+        psd (array): the concatenated PSD values of all PSDs.
+        noise (array): the output timestreams, (nstream x samples).
+
+       Returns:
+        None
+     */
+
+    int64_t fftlen = sim_noise_fftlen(samples, oversample);
+    int64_t npsd = (fftlen / 2) + 1;
+
+    uint64_t key1 = realization * 4294967296 + telescope * 65536 + component;
+    uint64_t counter1 = 0;
+    uint64_t counter2 = static_cast <uint64_t> (firstsamp * oversample);
+
+    // Check all PSDs before entering the threaded region, so that errors
+    // are raised from the calling thread.
+
+    toast::AlignedVector <int64_t> psdoffs(nstream);
+    toast::AlignedVector <double> psdmins(nstream);
+    int64_t psdoff = 0;
+    for (int64_t s = 0; s < nstream; ++s) {
+        psdoffs[s] = psdoff;
+        psdmins[s] = sim_noise_check_psd(rate, fftlen, freq + psdoff,
+                                         psd + psdoff, psdlens[s]);
+        psdoff += psdlens[s];
+    }
+
+    auto & store = toast::FFTPlanReal1DStore::get();
+    auto plan = store.backward(fftlen, nstream);
+
+    // This may run outside the calling python thread, so the team size is
+    // taken from the TOAST environment rather than the OpenMP default.
+    auto & env = toast::Environment::get();
+    int nthreads = env.current_threads();
+
+    // Each stream has an independent RNG stream and PSD, so the streams
+    // are filled concurrently.
+
+    #pragma omp parallel num_threads(nthreads) default(none) shared(rate, \
+    fftlen, npsd, nstream, obsindx, key1, counter1, counter2, detindx, \
+    psdlens, psdoffs, psdmins, freq, psd, plan)
+    {
+        toast::AlignedVector <double> interp_psd(npsd);
+
+        #pragma omp for schedule(static)
+        for (int64_t s = 0; s < nstream; ++s) {
+            sim_noise_interp_psd(rate, fftlen, freq + psdoffs[s],
+                                 psd + psdoffs[s], psdlens[s], psdmins[s],
+                                 interp_psd.data());
+            uint64_t key2 = obsindx * 4294967296 + detindx[s];
+            sim_noise_fill_fdata(key1, key2, counter1, counter2, fftlen,
+                                 interp_psd.data(), plan->fdata(s));
+        }
+    }
+
+    plan->exec();
+
+    #pragma omp parallel for num_threads(nthreads) schedule(static) \
+    default(none) shared(fftlen, samples, nstream, plan, noise)
+    for (int64_t s = 0; s < nstream; ++s) {
+        sim_noise_extract(fftlen, samples, plan->tdata(s),
+                          noise + s * samples);
+    }
+
+    return;
+}
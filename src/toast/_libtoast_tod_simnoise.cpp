@@ -78,5 +78,87 @@ void init_tod_simnoise(py::module & m) {
 
     )");
 
+    m.def("tod_sim_noise_timestream_batch",
+          [](uint64_t realization, uint64_t telescope, uint64_t component,
+             uint64_t obsindx, double rate, int64_t firstsamp, int64_t oversample,
+             py::buffer detindx, py::buffer psdlens, py::buffer freq,
+             py::buffer psd, py::buffer noise) {
+              pybuffer_check_1D <uint64_t> (detindx);
+              pybuffer_check_1D <int64_t> (psdlens);
+              pybuffer_check_1D <double> (freq);
+              pybuffer_check_1D <double> (psd);
+              pybuffer_check_1D <double> (noise);
+              py::buffer_info info_detindx = detindx.request();
+              py::buffer_info info_psdlens = psdlens.request();
+              py::buffer_info info_freq = freq.request();
+              py::buffer_info info_psd = psd.request();
+              py::buffer_info info_noise = noise.request();
+              int64_t nstream = info_detindx.size;
+              uint64_t * rawdetindx = reinterpret_cast <uint64_t *> (
+                  info_detindx.ptr);
+              int64_t * rawpsdlens = reinterpret_cast <int64_t *> (
+                  info_psdlens.ptr);
+              int64_t psdtot = 0;
+              for (int64_t s = 0; s < (int64_t)info_psdlens.size; ++s) {
+                  psdtot += rawpsdlens[s];
+              }
+              if (((int64_t)info_psdlens.size != nstream) ||
+                  ((int64_t)info_freq.size != psdtot) ||
+                  ((int64_t)info_psd.size != psdtot) ||
+                  (nstream == 0) ||
+                  ((int64_t)info_noise.size % nstream != 0)) {
+                  auto log = toast::Logger::get();
+                  std::ostringstream o;
+                  o << "Buffer sizes are not consistent.";
+                  log.error(o.str().c_str());
+                  throw std::runtime_error(o.str().c_str());
+              }
+              int64_t samples = info_noise.size / nstream;
+              double * rawfreq = reinterpret_cast <double *> (info_freq.ptr);
+              double * rawpsd = reinterpret_cast <double *> (info_psd.ptr);
+              double * rawnoise = reinterpret_cast <double *> (info_noise.ptr);
+
+              // The kernel does not touch any python objects, so other
+              // python threads may run while it works.
+              py::gil_scoped_release release;
+              toast::tod_sim_noise_timestream_batch(
+                  realization, telescope, component, obsindx, rate, firstsamp,
+                  samples, oversample, nstream, rawdetindx, rawpsdlens, rawfreq,
+                  rawpsd, rawnoise);
+              return;
+          }, py::arg("realization"), py::arg("telescope"), py::arg("component"),
+          py::arg("obsindx"), py::arg("rate"), py::arg("firstsamp"),
+          py::arg("oversample"), py::arg("detindx"), py::arg("psdlens"),
+          py::arg("freq"), py::arg("psd"), py::arg(
+              "noise"), R"(
+        Generate noise timestreams for several PSDs at once.
+
+        This is equivalent to calling tod_sim_noise_timestream() for every
+        stream, but the inverse FFTs of all streams are done with a single
+        batched plan.  All streams share the same sample range.  The GIL is
+        released while the streams are generated.
+
+        Args:
+            realization (int): the Monte Carlo realization.
+            telescope (int): a unique index assigned to a telescope.
+            component (int): a number representing the type of timestream
+                we are generating (detector noise, common mode noise,
+                atmosphere, etc).
+            obsindx (int): the global index of this observation.
+            rate (float): the sample rate.
+            firstsamp (int): the start sample in the stream.
+            oversample (int): the factor by which to expand the FFT length
+                beyond the number of samples.
+            detindx (array): the global index of each stream.
+            psdlens (array): the number of PSD points of each stream.
+            freq (array): the concatenated frequency points of all PSDs.
+            psd (array): the concatenated PSD values of all PSDs.
+            noise (array): the output noise timestreams, stream-major.
+
+        Returns:
+            None
+
+    )");
+
     return;
 }
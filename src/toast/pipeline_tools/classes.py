@@ -196,8 +196,7 @@ class Focalplane:
             "detectors = ("
             "".format(len(self.detector_data), self.sample_rate, self.radius)
         )
-        for detector_name, detector_data in self.detector_data.items():
-            value += "{}, ".format(detector_name)
+        value += "".join("{}, ".format(x) for x in self.detector_data.keys())
         value += "))"
         return value
 
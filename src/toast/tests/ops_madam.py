@@ -194,3 +194,89 @@ class OpMadamTest(MPITestCase):
                     raise Exception("Destriped TOD does not have lower RMS")
         else:
             print("libmadam not available, skipping tests")
+
+    def test_madam_mcmode(self):
+        rank = 0
+        if self.comm is not None:
+            rank = self.comm.rank
+
+        # add simple sky gradient signal
+        grad = OpSimGradient(nside=self.sim_nside, nest=True)
+        grad.exec(self.data)
+
+        # make a simple pointing matrix
+        pointing = OpPointingHpix(nside=self.map_nside, nest=True)
+        pointing.exec(self.data)
+
+        # Write outputs to a test-specific directory
+        mapdir = os.path.join(self.outdir, "mcmode")
+        if rank == 0:
+            if os.path.isdir(mapdir):
+                shutil.rmtree(mapdir)
+            os.makedirs(mapdir)
+
+        pars = {}
+        pars["kfirst"] = "T"
+        pars["iter_max"] = 100
+        pars["base_first"] = 5.0
+        pars["fsample"] = self.rate
+        pars["nside_map"] = self.map_nside
+        pars["nside_cross"] = self.map_nside
+        pars["nside_submap"] = min(8, self.map_nside)
+        pars["write_map"] = "F"
+        pars["write_binmap"] = "T"
+        pars["write_matrix"] = "F"
+        pars["write_wcov"] = "F"
+        pars["write_hits"] = "T"
+        pars["kfilter"] = "F"
+        pars["path_output"] = mapdir
+        pars["info"] = 0
+
+        madam = OpMadam(
+            params=pars,
+            name="grad",
+            name_out="destriped",
+            mcmode=True,
+            reuse_buffers=True,
+        )
+
+        if madam.available:
+            tod = self.data.obs[0]["tod"]
+
+            madam.exec(self.data)
+
+            first = dict()
+            for det in tod.local_dets:
+                first[det] = tod.cache.reference("destriped_" + det).copy()
+            signal = madam._cache.reference("signal")
+            address = signal.ctypes.data
+            del signal
+
+            # The second call must reuse the buffers and give the same output
+            madam.exec(self.data)
+
+            for det in tod.local_dets:
+                ref_out = tod.cache.reference("destriped_" + det)
+                self.assertTrue(np.allclose(ref_out, first[det], equal_nan=True))
+                del ref_out
+            signal = madam._cache.reference("signal")
+            self.assertEqual(signal.ctypes.data, address)
+
+            # A different number of samples reallocates the signal buffer
+            nsampdet = signal.size
+            dtype = signal.dtype
+            del signal
+            buf = madam._get_buffer("signal", dtype, (nsampdet + 1,))
+            self.assertEqual(buf.shape, (nsampdet + 1,))
+            del buf
+
+            # A different number of weights reallocates the weights buffer
+            weights = madam._cache.reference("pixweights")
+            nnz = weights.size // nsampdet
+            dtype = weights.dtype
+            del weights
+            buf = madam._get_buffer("pixweights", dtype, (nsampdet * (nnz - 1),))
+            self.assertEqual(buf.shape, (nsampdet * (nnz - 1),))
+            del buf
+        else:
+            print("libmadam not available, skipping tests")
@@ -8,7 +8,13 @@ import numpy as np
 
 from .mpi import MPITestCase
 
-from ..tod import Noise, sim_noise_timestream, AnalyticNoise, OpSimNoise
+from ..tod import (
+    Noise,
+    sim_noise_timestream,
+    sim_noise_timestream_batch,
+    AnalyticNoise,
+    OpSimNoise,
+)
 from ..todmap import TODHpixSpiral
 
 from .. import rng as rng
@@ -170,6 +176,188 @@ class OpSimNoiseTest(MPITestCase):
         )
         return
 
+    def test_sim_batch(self):
+        # Test that the batched simulation matches the single stream version.
+        ob = self.data.obs[0]
+        tod = ob["tod"]
+        nse = ob["noise"]
+        ntod = tod.local_samples[1]
+        dets = tod.local_dets
+
+        batch = sim_noise_timestream_batch(
+            1,
+            2,
+            3,
+            4,
+            [nse.index(det) for det in dets],
+            self.rate,
+            100,
+            ntod,
+            self.oversample,
+            [nse.freq(det) for det in dets],
+            [nse.psd(det) for det in dets],
+        )
+        self.assertEqual(batch.shape, (len(dets), ntod))
+
+        for idet, det in enumerate(dets):
+            single = sim_noise_timestream(
+                1,
+                2,
+                3,
+                4,
+                nse.index(det),
+                self.rate,
+                100,
+                ntod,
+                self.oversample,
+                nse.freq(det),
+                nse.psd(det),
+            )
+            np.testing.assert_array_almost_equal(batch[idet], single)
+        return
+
+    def test_sim_blocks(self):
+        # Test that simulating the correlated noise in several uneven blocks
+        # matches a sum of single stream simulations.
+        ob = self.data_corr.obs[0]
+        tod = ob["tod"]
+        nse = ob["noise"]
+        times = tod.local_times()
+        keys = list(nse.keys)
+
+        for batch in [1, 3]:
+            out = "blocks{}".format(batch)
+            op = OpSimNoise(out=out, realization=2, component=1, batch=batch)
+            op.exec(self.data_corr)
+
+            chunk_first = tod.local_samples[0]
+            for curchunk in range(tod.local_chunks[1]):
+                chunk_samp = tod.total_chunks[tod.local_chunks[0] + curchunk]
+                local_offset = chunk_first - tod.local_samples[0]
+                chunk_slice = slice(local_offset, local_offset + chunk_samp)
+                rate = 1 / np.median(np.diff(times[chunk_slice]))
+                streams = [
+                    sim_noise_timestream(
+                        2,
+                        0,
+                        1,
+                        ob["id"],
+                        nse.index(key),
+                        rate,
+                        chunk_first,
+                        chunk_samp,
+                        self.oversample,
+                        nse.freq(key),
+                        nse.psd(key),
+                    )
+                    for key in keys
+                ]
+                for det in tod.local_dets:
+                    expected = np.zeros(chunk_samp)
+                    for key, stream in zip(keys, streams):
+                        expected += nse.weight(det, key) * stream
+                    ref = tod.cache.reference("{}_{}".format(out, det))
+                    np.testing.assert_array_almost_equal(ref[chunk_slice], expected)
+                    del ref
+                chunk_first += chunk_samp
+        del times
+        return
+
+    def test_sim_py_paths(self):
+        # Test that every available implementation of the python branch gives
+        # the same timestream and interpolated PSD.
+        from scipy.interpolate import interp1d
+
+        from ..tod import _sim_noise_numba as kernels
+
+        ob = self.data.obs[0]
+        tod = ob["tod"]
+        nse = ob["noise"]
+        ntod = tod.local_samples[1]
+        det = tod.local_dets[-1]
+        freq = nse.freq(det)
+        psd = nse.psd(det)
+
+        def run():
+            return sim_noise_timestream(
+                1,
+                2,
+                3,
+                4,
+                nse.index(det),
+                self.rate,
+                100,
+                ntod,
+                self.oversample,
+                freq,
+                psd,
+                py=True,
+            )
+
+        saved = (kernels.sim_noise_fft, kernels.build_fdata, kernels.center)
+        results = list()
+        try:
+            if kernels.sim_noise_fft is not None:
+                results.append(run())
+            kernels.sim_noise_fft = None
+            if kernels.build_fdata is not None:
+                results.append(run())
+            kernels.build_fdata = None
+            kernels.center = None
+            reference = run()
+        finally:
+            kernels.sim_noise_fft, kernels.build_fdata, kernels.center = saved
+
+        for tdata, interp_freq, interp_psd in results:
+            np.testing.assert_allclose(tdata, reference[0], rtol=1e-10, atol=1e-10)
+            np.testing.assert_array_equal(interp_freq, reference[1])
+            np.testing.assert_allclose(interp_psd, reference[2], rtol=1e-10)
+
+        # Compare the NumPy interpolation to a direct log-log interpolation
+        interp_freq = reference[1]
+        freqshift = self.rate / (2 * (len(interp_freq) - 1))
+        psdshift = 0.01 * np.amin(psd[psd > 0])
+        interp = interp1d(
+            np.log10(freq + freqshift),
+            np.log10(psd + psdshift),
+            kind="linear",
+            fill_value="extrapolate",
+        )
+        check = np.power(10.0, interp(np.log10(interp_freq + freqshift))) - psdshift
+        check[0] = 0.0
+        np.testing.assert_allclose(reference[2], check, rtol=1e-10)
+        return
+
+    def test_sim_rate_cache(self):
+        # Test that repeated simulations reuse the chunk sample rates only
+        # while the timestamps are unchanged.
+        ob = self.data.obs[0]
+        tod = ob["tod"]
+
+        op = OpSimNoise(out="ratecache", realization=3)
+        op.exec(self.data)
+        rates = ob["_simnoise_rates"][1]
+        first = dict()
+        for det in tod.local_dets:
+            cachename = "ratecache_{}".format(det)
+            first[det] = tod.cache.reference(cachename).copy()
+            tod.cache.clear(cachename)
+
+        op.exec(self.data)
+        self.assertIs(ob["_simnoise_rates"][1], rates)
+        for det in tod.local_dets:
+            cachename = "ratecache_{}".format(det)
+            np.testing.assert_array_equal(tod.cache.reference(cachename), first[det])
+            tod.cache.clear(cachename)
+
+        # Changing the timestamps invalidates the cached rates
+        times = tod.local_times()
+        times *= 2
+        np.testing.assert_array_almost_equal(op._get_rates(ob, tod), 0.5 * rates)
+        times /= 2
+        del times
+        return
+
     def test_sim(self):
         # Test the uncorrelated noise generation.
 
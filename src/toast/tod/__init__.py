@@ -11,6 +11,7 @@ from .interval import Interval, OpFlagGaps
 from .tod_math import (
     calibrate,
     sim_noise_timestream,
+    sim_noise_timestream_batch,
     OpCacheCopy,
     OpCacheClear,
     flagged_running_average,
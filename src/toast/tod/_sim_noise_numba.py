@@ -0,0 +1,133 @@
+# Copyright (c) 2015-2020 by the parties listed in the AUTHORS file.
+# All rights reserved.  Use of this source code is governed by
+# a BSD-style license that can be found in the LICENSE file.
+
+"""Optional numba kernels for the python branch of sim_noise_timestream().
+
+Each kernel is None if its dependencies are not available.  build_fdata() and
+center() only need numba.  sim_noise_fft() also needs rocket-fft, which
+provides the numpy.fft functions inside compiled code.
+
+"""
+
+import numpy as np
+
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
+
+try:
+    import rocket_fft
+except ImportError:
+    rocket_fft = None
+
+build_fdata = None
+center = None
+sim_noise_fft = None
+
+if njit is not None:
+
+    @njit(fastmath=True, cache=True)
+    def loglog_interp(x, logfreq, logpsd):
+        """Linearly interpolate one point in log-log space.
+
+        Points outside the input range are extrapolated from the first / last
+        segment.
+
+        """
+        lo = 0
+        hi = logfreq.shape[0] - 1
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            if logfreq[mid] <= x:
+                lo = mid
+            else:
+                hi = mid
+        r = (x - logfreq[lo]) / (logfreq[lo + 1] - logfreq[lo])
+        return logpsd[lo] + r * (logpsd[lo + 1] - logpsd[lo])
+
+    @njit(parallel=True, fastmath=True, cache=True)
+    def build_fdata(
+        loginterp_freq, logfreq, logpsd, psdshift, norm, rngdata, interp_psd, fdata
+    ):
+        """Interpolate the PSD and build the scaled complex spectrum.
+
+        This fills `interp_psd` with the PSD at the FFT frequencies and packs
+        the Gaussian randoms in `rngdata` into the complex array `fdata`,
+        scaled by the square root of the normalized PSD.
+
+        """
+        fftlen = rngdata.shape[0]
+        npsd = fdata.shape[0]
+
+        # Zero out DC value
+        interp_psd[0] = 0.0
+        fdata[0] = 0.0
+
+        for i in prange(1, npsd - 1):
+            psdval = 10.0 ** loglog_interp(loginterp_freq[i], logfreq, logpsd)
+            psdval -= psdshift
+            interp_psd[i] = psdval
+            fdata[i] = np.sqrt(psdval * norm) * (rngdata[i] + 1j * rngdata[fftlen - i])
+
+        # The Nyquist frequency imaginary part is zero
+        nyqval = 10.0 ** loglog_interp(loginterp_freq[npsd - 1], logfreq, logpsd)
+        nyqval -= psdshift
+        interp_psd[npsd - 1] = nyqval
+        fdata[npsd - 1] = np.sqrt(nyqval * norm) * rngdata[npsd - 1]
+        return
+
+    @njit(fastmath=True, cache=True)
+    def center(x):
+        """Subtract the mean from `x` in place.
+
+        The second pass runs over data that the summation has just brought
+        into cache.
+
+        """
+        total = 0.0
+        for i in range(x.shape[0]):
+            total += x[i]
+        mean = total / x.shape[0]
+        for i in range(x.shape[0]):
+            x[i] -= mean
+        return
+
+    if rocket_fft is not None:
+
+        @njit(cache=True)
+        def sim_noise_fft(
+            loginterp_freq,
+            logfreq,
+            logpsd,
+            psdshift,
+            norm,
+            rngdata,
+            interp_psd,
+            samples,
+        ):
+            """Build the spectrum, transform it and center the output samples.
+
+            This is the compiled equivalent of the numpy code path: it fills
+            `interp_psd` as build_fdata() does and returns the central
+            `samples` points of the inverse FFT with their mean subtracted.
+
+            """
+            fftlen = rngdata.shape[0]
+            fdata = np.empty(interp_psd.shape[0], dtype=np.complex128)
+            build_fdata(
+                loginterp_freq,
+                logfreq,
+                logpsd,
+                psdshift,
+                norm,
+                rngdata,
+                interp_psd,
+                fdata,
+            )
+            tdata = np.fft.irfft(fdata, fftlen)
+            offset = (fftlen - samples) // 2
+            tdata = tdata[offset : offset + samples]
+            center(tdata)
+            return tdata
@@ -2,13 +2,17 @@
 # All rights reserved.  Use of this source code is governed by
 # a BSD-style license that can be found in the LICENSE file.
 
+from concurrent.futures import ThreadPoolExecutor, wait
+
 import numpy as np
 
 from ..timing import function_timer
 
+from ..utils import Environment
+
 from ..fft import FFTPlanReal1DStore
 
-from .tod_math import sim_noise_timestream
+from .tod_math import sim_noise_timestream_batch
 
 from ..op import Operator
 
@@ -31,11 +35,22 @@ class OpSimNoise(Operator):
             index.
         component (int): the component index to use for this noise simulation.
         noise (str): PSD key in the observation dictionary.
+        rate (float): the sample rate.  If None, it is computed from the
+            timestamps.
+        batch (int): the number of noise streams simulated together with
+            one batched FFT.  If None, use the number of threads, limited so
+            that the FFT work space of a block stays below 256 MB.
 
     """
 
     def __init__(
-        self, out="noise", realization=0, component=0, noise="noise", rate=None
+        self,
+        out="noise",
+        realization=0,
+        component=0,
+        noise="noise",
+        rate=None,
+        batch=None,
     ):
         # Call the parent class constructor.
         super().__init__()
@@ -46,6 +61,7 @@ class OpSimNoise(Operator):
         self._component = component
         self._noisekey = noise
         self._rate = rate
+        self._batch = batch
 
     @function_timer
     def exec(self, data):
@@ -64,59 +80,134 @@ class OpSimNoise(Operator):
             RuntimeError: If observations are not split into chunks.
 
         """
-        for obs in data.obs:
-            obsindx = 0
-            if "id" in obs:
-                obsindx = obs["id"]
-            else:
-                print("Warning: observation ID is not set, using zero!")
+        # The compiled simulation of every chunk runs in the same background
+        # thread, which is shut down when we are done.
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            for obs in data.obs:
+                obsindx = 0
+                if "id" in obs:
+                    obsindx = obs["id"]
+                else:
+                    print("Warning: observation ID is not set, using zero!")
 
-            telescope = 0
-            if "telescope" in obs:
-                telescope = obs["telescope_id"]
+                telescope = 0
+                if "telescope" in obs:
+                    telescope = obs["telescope_id"]
 
-            global_offset = 0
-            if "global_offset" in obs:
-                global_offset = obs["global_offset"]
+                global_offset = 0
+                if "global_offset" in obs:
+                    global_offset = obs["global_offset"]
 
-            tod = obs["tod"]
-            if self._noisekey in obs:
-                nse = obs[self._noisekey]
-            else:
-                raise KeyError(
-                    "Observation does not contain noise under "
-                    '"{}"'.format(self._noisekey)
-                )
-            if tod.local_chunks is None:
-                raise RuntimeError(
-                    "noise simulation for uniform distributed "
-                    "samples not implemented"
-                )
+                tod = obs["tod"]
+                if self._noisekey in obs:
+                    nse = obs[self._noisekey]
+                else:
+                    raise KeyError(
+                        "Observation does not contain noise under "
+                        '"{}"'.format(self._noisekey)
+                    )
+                if tod.local_chunks is None:
+                    raise RuntimeError(
+                        "noise simulation for uniform distributed "
+                        "samples not implemented"
+                    )
 
-            # eventually we'll redistribute, to allow long correlations...
+                # eventually we'll redistribute, to allow long correlations...
 
-            if self._rate is None:
-                times = tod.local_times()
-            else:
-                times = None
-
-            # Iterate over each chunk.
-
-            chunk_first = tod.local_samples[0]
-            for curchunk in range(tod.local_chunks[1]):
-                chunk_first += self.simulate_chunk(
-                    tod=tod,
-                    nse=nse,
-                    curchunk=curchunk,
-                    chunk_first=chunk_first,
-                    obsindx=obsindx,
-                    times=times,
-                    telescope=telescope,
-                    global_offset=global_offset,
-                )
+                if self._rate is None:
+                    rates = self._get_rates(obs, tod)
+                else:
+                    rates = None
+
+                # The noise streams needed by the local detectors are the same
+                # for every chunk.
+
+                streams = self._get_streams(tod, nse)
+
+                # Iterate over each chunk.
+
+                chunk_first = tod.local_samples[0]
+                for curchunk in range(tod.local_chunks[1]):
+                    chunk_first += self.simulate_chunk(
+                        tod=tod,
+                        nse=nse,
+                        curchunk=curchunk,
+                        chunk_first=chunk_first,
+                        obsindx=obsindx,
+                        times=None,
+                        telescope=telescope,
+                        global_offset=global_offset,
+                        streams=streams,
+                        rate=None if rates is None else rates[curchunk],
+                        pool=pool,
+                    )
 
         return
 
+    def _get_rates(self, obs, tod):
+        """Get the effective sample rate of each local chunk.
+
+        The rates only depend on the timestamps, so they are stored in the
+        observation under a private key, together with the TOD, its local
+        chunks and the first and last local timestamps.  Later realizations
+        and components reuse them only if all of these still match.
+
+        Args:
+            obs (dict): The observation.
+            tod (toast.tod.TOD): TOD object for the observation.
+
+        Returns:
+            (array):  the sample rate of each local chunk.
+
+        """
+        times = tod.local_times()
+        if len(times) > 0:
+            state = (tod, tuple(tod.local_chunks), times[0], times[-1])
+        else:
+            state = (tod, tuple(tod.local_chunks), None, None)
+        cached = obs.get("_simnoise_rates", None)
+        if cached is not None and cached[0] == state:
+            return cached[1]
+        nchunk = tod.local_chunks[1]
+        rates = np.zeros(nchunk, dtype=np.float64)
+        chunk_first = 0
+        for curchunk in range(nchunk):
+            chunk_samp = tod.total_chunks[tod.local_chunks[0] + curchunk]
+            rates[curchunk] = 1 / np.median(
+                np.diff(times[chunk_first : chunk_first + chunk_samp])
+            )
+            chunk_first += chunk_samp
+        del times
+        obs["_simnoise_rates"] = (state, rates)
+        return rates
+
+    def _get_streams(self, tod, nse):
+        """Collect the noise streams needed by the local detectors.
+
+        Args:
+            tod (toast.tod.TOD): TOD object for the observation.
+            nse (toast.tod.Noise): Noise object for the observation.
+
+        Returns:
+            (tuple):  the stream indices, the float64 frequencies and PSDs of
+                each stream and the (local detectors x streams) mixing matrix.
+                Only keys with a nonzero weight for some local detector are
+                included.
+
+        """
+        keys = list(nse.keys)
+        weights = np.array(
+            [[nse.weight(det, key) for key in keys] for det in tod.local_dets],
+            dtype=np.float64,
+        ).reshape((len(tod.local_dets), len(keys)))
+        needed = np.any(weights != 0, axis=0)
+        keys = [key for key, good in zip(keys, needed) if good]
+        indices = [nse.index(key) for key in keys]
+        freqs = [np.ascontiguousarray(nse.freq(key), dtype=np.float64) for key in keys]
+        psds = [np.ascontiguousarray(nse.psd(key), dtype=np.float64) for key in keys]
+        weights = np.ascontiguousarray(weights[:, needed])
+        return indices, freqs, psds, weights
+
     @function_timer
     def simulate_chunk(
         self,
@@ -128,7 +219,10 @@ class OpSimNoise(Operator):
         obsindx,
         times,
         telescope,
-        global_offset
+        global_offset,
+        streams=None,
+        rate=None,
+        pool=None
     ):
         """Simulate one chunk of noise for all detectors.
 
@@ -141,6 +235,15 @@ class OpSimNoise(Operator):
             times (int): Timestamps for effective sample rate.
             telescope (int): Telescope index for random number stream.
             global_offset (int): Global offset for random number stream.
+            streams (tuple): The noise streams of the local detectors, as
+                returned by _get_streams().  If None, they are computed
+                from the noise object.
+            rate (float): The effective sample rate of the chunk.  If None,
+                the rate given to the constructor is used or the rate is
+                computed from the timestamps.
+            pool (ThreadPoolExecutor): Single worker executor that runs the
+                compiled simulation.  If None, a new one is used for this
+                chunk.
 
         Returns:
             chunk_samp (int): Number of simulated samples
@@ -149,54 +252,104 @@ class OpSimNoise(Operator):
         chunk_samp = tod.total_chunks[tod.local_chunks[0] + curchunk]
         local_offset = chunk_first - tod.local_samples[0]
 
-        if self._rate is None:
-            # compute effective sample rate
-            rate = 1 / np.median(
-                np.diff(times[local_offset : local_offset + chunk_samp])
-            )
+        if rate is None:
+            if self._rate is None:
+                # compute effective sample rate
+                rate = 1 / np.median(
+                    np.diff(times[local_offset : local_offset + chunk_samp])
+                )
+            else:
+                rate = self._rate
+
+        # Resolve the loop invariants once
+        realization = self._realization
+        component = self._component
+        oversample = self._oversample
+        firstsamp = chunk_first + global_offset
+        local_dets = tod.local_dets
+        nlocal = tod.local_samples[1]
+        chunk_slice = slice(local_offset, local_offset + chunk_samp)
+
+        if streams is None:
+            streams = self._get_streams(tod, nse)
+        indices, freqs, psds, weights = streams
+
+        # Simulate the noise for blocks of keys.  All streams in a block are
+        # transformed with one batched FFT, whose work space holds two
+        # fftlen-sized double arrays per stream.
+        if self._batch is None:
+            fftlen = 2
+            while fftlen <= (oversample * chunk_samp):
+                fftlen *= 2
+            nbatch = min(Environment.get().max_threads(), 2 ** 28 // (16 * fftlen))
+            nbatch = max(1, nbatch)
         else:
-            rate = self._rate
-
-        for key in nse.keys:
-            # Check if noise matching this PSD key is needed
-            weight = 0.0
-            for det in tod.local_dets:
-                weight += np.abs(nse.weight(det, key))
-            if weight == 0:
-                continue
-
-            # Simulate the noise matching this key
-            nsedata = sim_noise_timestream(
-                self._realization,
+            nbatch = self._batch
+        batches = [
+            slice(first, first + nbatch) for first in range(0, len(indices), nbatch)
+        ]
+        mixed = np.empty(chunk_samp, dtype=np.float64)
+
+        def simulate(batch):
+            if len(indices[batch]) < nbatch:
+                # The last block is smaller.  Free the full-size plan before
+                # the smaller one is built, so they are never held together.
+                FFTPlanReal1DStore.get().clear()
+            return sim_noise_timestream_batch(
+                realization,
                 telescope,
-                self._component,
+                component,
                 obsindx,
-                nse.index(key),
+                indices[batch],
                 rate,
-                chunk_first + global_offset,
+                firstsamp,
                 chunk_samp,
-                self._oversample,
-                nse.freq(key),
-                nse.psd(key),
+                oversample,
+                freqs[batch],
+                psds[batch],
             )
 
-            # Add the noise to all detectors that have nonzero weights
-            for det in tod.local_dets:
-                weight = nse.weight(det, key)
-                if weight == 0:
-                    continue
-                cachename = "{}_{}".format(self._out, det)
-                if tod.cache.exists(cachename):
-                    ref = tod.cache.reference(cachename)
-                else:
-                    ref = tod.cache.create(
-                        cachename, np.float64, (tod.local_samples[1],)
-                    )
-                ref[local_offset : local_offset + chunk_samp] += weight * nsedata
-                del ref
-
-        # Release the work space allocated in the FFT plan store.
-        store = FFTPlanReal1DStore.get()
-        store.clear()
+        # The compiled simulation releases the GIL, so the next block is
+        # simulated in a background thread while the current block is added
+        # to the detectors.  On errors we wait for the worker before the plan
+        # store is cleared.
+        own_pool = pool is None
+        if own_pool:
+            pool = ThreadPoolExecutor(max_workers=1)
+        pending = None
+        try:
+            if len(batches) > 0:
+                pending = pool.submit(simulate, batches[0])
+            for ibatch, batch in enumerate(batches):
+                nsedata = pending.result()
+                if ibatch + 1 < len(batches):
+                    pending = pool.submit(simulate, batches[ibatch + 1])
+
+                # Mixing matrix of this block, one row per local detector
+                block_weights = weights[:, batch]
+
+                # Add the noise to all detectors that have nonzero weights.
+                # The streams of the block are mixed with one matrix-vector
+                # product per detector.
+                for idet, det in enumerate(local_dets):
+                    if not np.any(block_weights[idet]):
+                        continue
+                    cachename = "{}_{}".format(self._out, det)
+                    if tod.cache.exists(cachename):
+                        ref = tod.cache.reference(cachename)
+                    else:
+                        ref = tod.cache.create(cachename, np.float64, (nlocal,))
+                    np.dot(block_weights[idet], nsedata, out=mixed)
+                    ref[chunk_slice] += mixed
+                    del ref
+                del nsedata
+        finally:
+            if pending is not None:
+                wait([pending])
+            if own_pool:
+                pool.shutdown(wait=True)
+            # Release the work space allocated in the FFT plan store.
+            store = FFTPlanReal1DStore.get()
+            store.clear()
 
         return chunk_samp
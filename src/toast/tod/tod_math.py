@@ -4,18 +4,18 @@
 
 import numpy as np
 
-import scipy.interpolate as si
+from scipy import fft as spfft
 from scipy.signal import fftconvolve
 
 from ..op import Operator
 
 from ..timing import function_timer
 
-from ..utils import Logger, AlignedF64
+from ..utils import Logger, Environment, AlignedF64, set_numba_threading
 
 from .. import rng as rng
 
-from .._libtoast import tod_sim_noise_timestream
+from .._libtoast import tod_sim_noise_timestream, tod_sim_noise_timestream_batch
 
 
 class OpCacheInit(Operator):
@@ -230,25 +230,23 @@ def sim_noise_timestream(
         psdshift = 0.01 * np.amin(psd[(psd > 0.0)])
         freqshift = increment
 
-        loginterp_freq = np.log10(interp_freq + freqshift)
-        logfreq = np.log10(freq + freqshift)
-        logpsd = np.log10(psd + psdshift)
-
-        interp = si.interp1d(logfreq, logpsd, kind="linear", fill_value="extrapolate")
-
-        loginterp_psd = interp(loginterp_freq)
-        interp_psd = np.power(10.0, loginterp_psd) - psdshift
-
-        # Zero out DC value
-
-        interp_psd[0] = 0.0
-
-        scale = np.sqrt(interp_psd * norm)
-
-        # gaussian Re/Im randoms, packed into a complex valued array
-
-        key1 = realization * 4294967296 + telescope * 65536 + component
-        key2 = obsindx * 4294967296 + detindx
+        loginterp_freq = np.add(interp_freq, freqshift)
+        np.log10(loginterp_freq, out=loginterp_freq)
+        logfreq = np.add(freq, freqshift, dtype=np.float64)
+        np.log10(logfreq, out=logfreq)
+        logpsd = np.add(psd, psdshift, dtype=np.float64)
+        np.log10(logpsd, out=logpsd)
+
+        # gaussian Re/Im randoms
+
+        # Compose the keys in fixed-width unsigned arithmetic, matching
+        # the compiled code.
+        key1 = (
+            (np.uint64(realization) << np.uint64(32))
+            + (np.uint64(telescope) << np.uint64(16))
+            + np.uint64(component)
+        )
+        key2 = (np.uint64(obsindx) << np.uint64(32)) + np.uint64(detindx)
         counter1 = 0
         counter2 = firstsamp * oversample
 
@@ -256,27 +254,100 @@ def sim_noise_timestream(
             fftlen, sampler="gaussian", key=(key1, key2), counter=(counter1, counter2)
         ).array()
 
-        fdata = np.zeros(npsd, dtype=np.complex)
-
-        # Set the DC and Nyquist frequency imaginary part to zero
-        fdata[0] = rngdata[0] + 0.0j
-        fdata[-1] = rngdata[npsd - 1] + 0.0j
-
-        # Repack the other values.
-        fdata[1:-1] = rngdata[1 : npsd - 1] + 1j * rngdata[-1 : npsd - 1 : -1]
-
-        # scale by PSD
-        fdata *= scale
-
-        # inverse FFT
-        tdata = np.fft.irfft(fdata)
+        # The optional numba kernels are only needed by this branch, so they
+        # are imported on first use.
+        from . import _sim_noise_numba as kernels
+
+        if kernels.sim_noise_fft is not None:
+            # Build the spectrum, transform and center in compiled code.
+            set_numba_threading()
+            interp_psd = np.empty(npsd, dtype=np.float64)
+            tdata = kernels.sim_noise_fft(
+                loginterp_freq,
+                logfreq,
+                logpsd,
+                psdshift,
+                norm,
+                rngdata,
+                interp_psd,
+                samples,
+            )
+            return (tdata, interp_freq, interp_psd)
+
+        if kernels.build_fdata is not None:
+            # Interpolate, scale and pack the complex spectrum in a single pass.
+            set_numba_threading()
+            interp_psd = np.empty(npsd, dtype=np.float64)
+            fdata = np.empty(npsd, dtype=np.complex128)
+            kernels.build_fdata(
+                loginterp_freq,
+                logfreq,
+                logpsd,
+                psdshift,
+                norm,
+                rngdata,
+                interp_psd,
+                fdata,
+            )
+        else:
+            # Piecewise linear interpolation in log-log space.  Points outside
+            # the input frequency range are linearly extrapolated from the
+            # first / last segment.
+
+            loginterp_psd = np.interp(loginterp_freq, logfreq, logpsd)
+
+            low = loginterp_freq < logfreq[0]
+            if np.any(low):
+                slope = (logpsd[1] - logpsd[0]) / (logfreq[1] - logfreq[0])
+                loginterp_psd[low] = logpsd[0] + slope * (
+                    loginterp_freq[low] - logfreq[0]
+                )
+
+            high = loginterp_freq > logfreq[-1]
+            if np.any(high):
+                slope = (logpsd[-1] - logpsd[-2]) / (logfreq[-1] - logfreq[-2])
+                loginterp_psd[high] = logpsd[-1] + slope * (
+                    loginterp_freq[high] - logfreq[-1]
+                )
+
+            interp_psd = np.power(10.0, loginterp_psd, out=loginterp_psd)
+            interp_psd -= psdshift
+
+            # Zero out DC value
+
+            interp_psd[0] = 0.0
+
+            # Pack the randoms directly into the real and imaginary parts of
+            # the spectrum.  The DC and Nyquist frequency imaginary parts
+            # are zero.
+
+            fdata = np.empty(npsd, dtype=np.complex128)
+            fdata.real = rngdata[:npsd]
+            fdata.imag[1:-1] = rngdata[-1 : npsd - 1 : -1]
+            fdata.imag[0] = 0.0
+            fdata.imag[-1] = 0.0
+
+            # scale by PSD.  The randoms have been copied, so their buffer
+            # is reused for the scale factors.
+            scale = rngdata[:npsd]
+            np.multiply(interp_psd, norm, out=scale)
+            np.sqrt(scale, out=scale)
+            fdata *= scale
+
+        # inverse FFT, threaded over the same number of workers as the
+        # compiled code.  The spectrum is not needed afterwards.
+        nthread = Environment.get().max_threads()
+        tdata = spfft.irfft(fdata, n=fftlen, workers=nthread, overwrite_x=True)
 
         # subtract the DC level- for just the samples that we are returning
         offset = (fftlen - samples) // 2
 
-        DC = np.mean(tdata[offset : offset + samples])
-        tdata[offset : offset + samples] -= DC
-        return (tdata[offset : offset + samples], interp_freq, interp_psd)
+        tdata = tdata[offset : offset + samples]
+        if kernels.center is not None:
+            kernels.center(tdata)
+        else:
+            tdata -= np.mean(tdata)
+        return (tdata, interp_freq, interp_psd)
     else:
         tdata = AlignedF64(samples)
         tod_sim_noise_timestream(
@@ -288,13 +359,73 @@ def sim_noise_timestream(
             rate,
             firstsamp,
             oversample,
-            freq.astype(np.float64),
-            psd.astype(np.float64),
+            np.ascontiguousarray(freq, dtype=np.float64),
+            np.ascontiguousarray(psd, dtype=np.float64),
             tdata,
         )
         return tdata.array()
 
 
+@function_timer
+def sim_noise_timestream_batch(
+    realization,
+    telescope,
+    component,
+    obsindx,
+    detindices,
+    rate,
+    firstsamp,
+    samples,
+    oversample,
+    freqs,
+    psds,
+):
+    """Generate noise timestreams for several PSDs at once.
+
+    This produces the same timestreams as calling sim_noise_timestream() for
+    each PSD in turn, but all the streams share a single batched FFT plan.
+    See sim_noise_timestream() for a description of the RNG parameters.
+
+    Args:
+        realization (int): the Monte Carlo realization.
+        telescope (int): a unique index assigned to a telescope.
+        component (int): a number representing the type of timestream
+            we are generating (detector noise, common mode noise,
+            atmosphere, etc).
+        obsindx (int): the global index of this observation.
+        detindices (list): the global index of each stream.
+        rate (float): the sample rate.
+        firstsamp (int): the start sample in the stream.
+        samples (int): the number of samples to generate.
+        oversample (int): the factor by which to expand the FFT length
+            beyond the number of samples.
+        freqs (list): the frequency points of each PSD.
+        psds (list): the PSD values of each PSD.
+
+    Returns:
+        (array):  the noise timestreams with shape (len(detindices), samples).
+
+    """
+    nstream = len(detindices)
+    psdlens = np.array([len(x) for x in freqs], dtype=np.int64)
+    tdata = AlignedF64(nstream * samples)
+    tod_sim_noise_timestream_batch(
+        realization,
+        telescope,
+        component,
+        obsindx,
+        rate,
+        firstsamp,
+        oversample,
+        np.array(detindices, dtype=np.uint64),
+        psdlens,
+        np.concatenate(freqs).astype(np.float64, copy=False),
+        np.concatenate(psds).astype(np.float64, copy=False),
+        tdata,
+    )
+    return tdata.array().reshape((nstream, samples))
+
+
 class OpCacheCopy(Operator):
     """Operator which copies sets of timestreams between cache locations.
 
@@ -86,12 +86,20 @@ class OpMadam(Operator):
             available detectors are mapped.
         mcmode (bool): If true, the operator is constructed in
             Monte Carlo mode and Madam will cache auxiliary information
-            such as pixel matrices and noise filter.
+            such as pixel matrices and noise filter.  The Madam data
+            buffers are still freed after every call unless reuse_buffers
+            is set, since keeping them doubles the memory used by the data.
         noise (str): Keyword to use when retrieving the noise object
             from the observation.
         conserve_memory(bool/int): Stagger the Madam buffer staging on node.
         translate_timestamps(bool): Translate timestamps to enforce
             monotonity.
+        reuse_buffers(bool): Keep the Madam data buffers between calls and
+            reuse them when their size does not change.  This avoids
+            reallocating them in Monte Carlo mode, but the buffers then hold
+            a second copy of the timestamps, signal, pixels and weights for
+            the lifetime of the operator, on top of the TOAST caches.  This
+            defeats the purge options and conserve_memory.
 
     """
 
@@ -120,6 +128,7 @@ class OpMadam(Operator):
         intervals="intervals",
         conserve_memory=True,
         translate_timestamps=True,
+        reuse_buffers=False,
     ):
         # Call the parent class constructor
         super().__init__()
@@ -173,6 +182,7 @@ class OpMadam(Operator):
             conserve_memory = True
         self._conserve_memory = int(conserve_memory)
         self._translate_timestamps = translate_timestamps
+        self._reuse_buffers = reuse_buffers
         if "info" in params:
             self._verbose = int(params["info"]) > 0
         else:
@@ -305,6 +315,28 @@ class OpMadam(Operator):
                 self._cached = True
         return
 
+    def _get_buffer(self, name, dtype, shape):
+        """Return the named Madam buffer.
+
+        If buffers are reused, a buffer left over from a previous call is
+        returned when it has the requested type and shape.  Otherwise a new
+        buffer is allocated.
+
+        """
+        if self._cache.exists(name):
+            buf = self._cache.reference(name)
+            if buf.dtype == np.dtype(dtype) and buf.shape == shape:
+                return buf
+            del buf
+            self._cache.destroy(name)
+        return self._cache.create(name, dtype, shape)
+
+    def _release_buffer(self, name):
+        """Free the named Madam buffer unless buffers are reused."""
+        if not self._reuse_buffers:
+            self._cache.destroy(name)
+        return
+
     def _count_samples(self):
         """Loop over the observations and count the number of samples."""
         if len(self._data.obs) != 1:
@@ -366,27 +398,46 @@ class OpMadam(Operator):
                                 " the same frequency binning."
                             )
             # Collect the valid intervals for this observation
-            period_ranges = []
             if self._intervals in obs:
                 intervals = obs[self._intervals]
             else:
                 intervals = None
-            local_intervals = tod.local_intervals(intervals)
+            offset, nlocal = tod.local_samples
+            if len(tod.local_times()) != nlocal:
+                raise RuntimeError(
+                    "Length of cached timestamps does not match local samples. "
+                    "Cannot produce local intervals."
+                )
+            if intervals is None:
+                firsts = np.zeros(1, dtype=np.int64)
+                lasts = np.array([tod.total_samples - 1], dtype=np.int64)
+            else:
+                nival = len(intervals)
+                firsts = np.fromiter(
+                    (ival.first for ival in intervals), dtype=np.int64, count=nival
+                )
+                lasts = np.fromiter(
+                    (ival.last for ival in intervals), dtype=np.int64, count=nival
+                )
 
-            for ival in local_intervals:
-                local_start = ival.first
-                local_stop = ival.last + 1
-                if local_stop - local_start < norder:
-                    continue
-                period_lengths.append(local_stop - local_start)
-                period_ranges.append((local_start, local_stop))
-            obs_period_ranges.append(period_ranges)
+            # Translate the intervals that overlap our samples into local
+            # sample ranges and discard the short ones
+            local = np.logical_and(lasts >= offset, firsts < offset + nlocal)
+            local_starts = np.maximum(firsts[local] - offset, 0)
+            local_stops = np.minimum(lasts[local] - offset, nlocal - 1) + 1
+            lengths = local_stops - local_starts
+            good = lengths >= norder
+
+            period_lengths.append(lengths[good])
+            obs_period_ranges.append(
+                list(zip(local_starts[good].tolist(), local_stops[good].tolist()))
+            )
 
         # Update the number of samples based on the valid intervals
 
         nsamp_tot_full = self._comm.allreduce(nsamp, op=MPI.SUM)
+        period_lengths = np.hstack(period_lengths)
         nperiod = len(period_lengths)
-        period_lengths = np.array(period_lengths, dtype=np.int64)
         nsamp = np.sum(period_lengths, dtype=np.int64)
         nsamp_tot = self._comm.allreduce(nsamp, op=MPI.SUM)
         if nsamp_tot == 0:
@@ -402,8 +453,7 @@ class OpMadam(Operator):
 
         # Madam expects starting indices, not period lengths
         periods = np.zeros(nperiod, dtype=np.int64)
-        for i, n in enumerate(period_lengths[:-1]):
-            periods[i + 1] = periods[i] + n
+        np.cumsum(period_lengths[:-1], out=periods[1:])
 
         self._comm.Barrier()
         if self._verbose and self._rank == 0:
@@ -495,7 +545,7 @@ class OpMadam(Operator):
     @function_timer
     def _stage_time(self, detectors, nsamp, obs_period_ranges):
         """Stage the timestamps and use them to build PSD inputs."""
-        self._madam_timestamps = self._cache.create(
+        self._madam_timestamps = self._get_buffer(
             "timestamps", madam.TIMESTAMP_TYPE, (nsamp,)
         )
 
@@ -557,7 +607,7 @@ class OpMadam(Operator):
             timer.start()
             if nodecomm.rank % nread == iread:
                 # Allocate Madam buffer
-                self._madam_signal = self._cache.create(
+                self._madam_signal = self._get_buffer(
                     "signal", madam.SIGNAL_TYPE, (nsamp * ndet,)
                 )
                 self._madam_signal[:] = np.nan
@@ -596,7 +646,7 @@ class OpMadam(Operator):
     @function_timer
     def _stage_pixels(self, detectors, nsamp, ndet, obs_period_ranges, nside):
         """Stage pixels"""
-        self._madam_pixels = self._cache.create(
+        self._madam_pixels = self._get_buffer(
             "pixels", madam.PIXEL_TYPE, (nsamp * ndet,)
         )
         self._madam_pixels[:] = -1
@@ -607,16 +657,18 @@ class OpMadam(Operator):
             period_ranges = obs_period_ranges[iobs]
 
             commonflags = None
+            if self._apply_flags:
+                commonflags = tod.local_common_flags(self._common_flag_name)
+                commonflags = (commonflags & self._common_flag_mask) != 0
+
             for idet, det in enumerate(detectors):
                 # Optionally get the flags, otherwise they are
                 # assumed to have been applied to the pixel numbers.
 
                 if self._apply_flags:
                     detflags = tod.local_flags(det, self._flag_name)
-                    commonflags = tod.local_common_flags(self._common_flag_name)
                     flags = np.logical_or(
-                        (detflags & self._flag_mask) != 0,
-                        (commonflags & self._common_flag_mask) != 0,
+                        (detflags & self._flag_mask) != 0, commonflags
                     )
                     del detflags
 
@@ -626,21 +678,22 @@ class OpMadam(Operator):
                 pixels = tod.cache.reference(pixelsname)
                 pixels_dtype = pixels.dtype
 
-                if not self._pixels_nested:
-                    # Madam expects the pixels to be in nested ordering
-                    pixels = pixels.copy()
-                    good = pixels >= 0
-                    pixels[good] = hp.ring2nest(nside, pixels[good])
-
-                if self._apply_flags:
-                    pixels = pixels.copy()
-                    pixels[flags] = -1
+                # Copy the pixels directly into the Madam buffer and do the
+                # reordering and flagging there, rather than on a private
+                # copy of the full detector timestream.
 
                 offset = global_offset
                 for istart, istop in period_ranges:
                     nn = istop - istart
                     dslice = slice(idet * nsamp + offset, idet * nsamp + offset + nn)
-                    self._madam_pixels[dslice] = pixels[istart:istop]
+                    madam_pixels = self._madam_pixels[dslice]
+                    madam_pixels[:] = pixels[istart:istop]
+                    if not self._pixels_nested:
+                        # Madam expects the pixels to be in nested ordering
+                        good = madam_pixels >= 0
+                        madam_pixels[good] = hp.ring2nest(nside, madam_pixels[good])
+                    if self._apply_flags:
+                        madam_pixels[flags[istart:istop]] = -1
                     offset += nn
 
                 del pixels
@@ -694,7 +747,7 @@ class OpMadam(Operator):
             timer.start()
             if nodecomm.rank % nread == iread:
                 # Allocate Madam buffer
-                self._madam_pixweights = self._cache.create(
+                self._madam_pixweights = self._get_buffer(
                     "pixweights", madam.WEIGHT_TYPE, (nsamp * ndet * nnz,)
                 )
                 self._madam_pixweights[:] = 0
@@ -716,9 +769,13 @@ class OpMadam(Operator):
                                 (idet * nsamp + offset) * nnz,
                                 (idet * nsamp + offset + nn) * nnz,
                             )
-                            self._madam_pixweights[dwslice] = weights[
-                                istart:istop
-                            ].flatten()[::nnz_stride]
+                            # Assign through a 2D view of the Madam buffer so
+                            # the selected weight columns are copied without
+                            # a flattened temporary.
+                            madam_weights = self._madam_pixweights[dwslice]
+                            madam_weights.reshape(nn, nnz)[:] = weights[
+                                istart:istop, ::nnz_stride
+                            ]
                             offset += nn
                         del weights
                     # Purge the weights but restore them from the Madam
@@ -861,27 +918,31 @@ class OpMadam(Operator):
         else:
             detw = self._detw
 
-        detweights = np.zeros(ndet, dtype=np.float64)
-        for idet, det in enumerate(detectors):
-            detweights[idet] = detw[det]
+        detweights = np.fromiter(
+            (detw[det] for det in detectors), dtype=np.float64, count=ndet
+        )
 
         if len(psds) > 0:
             npsdbin = len(psdfreqs)
 
             npsd = np.zeros(ndet, dtype=np.int64)
-            psdstarts = []
-            psdvals = []
             for idet, det in enumerate(detectors):
                 if det not in psds:
                     raise RuntimeError("Every detector must have at least " "one PSD")
-                psdlist = psds[det]
-                npsd[idet] = len(psdlist)
-                for psdstart, psd in psdlist:
-                    psdstarts.append(psdstart)
-                    psdvals.append(psd)
+                npsd[idet] = len(psds[det])
             npsdtot = np.sum(npsd)
-            psdstarts = np.array(psdstarts, dtype=np.float64)
-            psdvals = np.hstack(psdvals).astype(madam.PSD_TYPE)
+
+            # Copy the PSDs straight into one (npsdtot x npsdbin) buffer
+            psdstarts = np.empty(npsdtot, dtype=np.float64)
+            psdvals = np.empty(npsdtot * npsdbin, dtype=madam.PSD_TYPE)
+            psdrows = psdvals.reshape((npsdtot, npsdbin))
+            ipsd = 0
+            for det in detectors:
+                for psdstart, psd in psds[det]:
+                    psdstarts[ipsd] = psdstart
+                    psdrows[ipsd] = psd
+                    ipsd += 1
+            del psdrows
             npsdval = psdvals.size
         else:
             npsd = np.ones(ndet, dtype=np.int64)
@@ -918,7 +979,7 @@ class OpMadam(Operator):
                     tod.cache.put(cachename, signal, replace=True)
                 global_offset = offset
         self._madam_signal = None
-        self._cache.destroy("signal")
+        self._release_buffer("signal")
         return
 
     @function_timer
@@ -948,7 +1009,7 @@ class OpMadam(Operator):
                     tod.cache.put(cachename, pixels, replace=True)
                 global_offset = offset
         self._madam_pixels = None
-        self._cache.destroy("pixels")
+        self._release_buffer("pixels")
         return
 
     @function_timer
@@ -978,7 +1039,7 @@ class OpMadam(Operator):
                     tod.cache.put(cachename, weights, replace=True)
                 global_offset = offset
         self._madam_pixweights = None
-        self._cache.destroy("pixweights")
+        self._release_buffer("pixweights")
         return
 
     @function_timer
@@ -1000,7 +1061,7 @@ class OpMadam(Operator):
         """
         log = Logger.get()
         self._madam_timestamps = None
-        self._cache.destroy("timestamps")
+        self._release_buffer("timestamps")
 
         if self._conserve_memory:
             nodecomm = self._comm.Split_type(MPI.COMM_TYPE_SHARED, self._rank)
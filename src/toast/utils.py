@@ -77,12 +77,14 @@ def set_numba_threading():
     env = Environment.get()
     log = Logger.get()
     toastthreads = env.max_threads()
-    print("max toast threads = ", toastthreads, flush=True)
 
     rank = 0
     if use_mpi:
         rank = MPI.COMM_WORLD.rank
 
+    if rank == 0:
+        log.debug("max toast threads = {}".format(toastthreads))
+
     threading = "default"
     have_numba_omp = False
     try: